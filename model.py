@@ -0,0 +1,210 @@
+import os
+import json
+from enum import Enum
+
+import numpy as np
+import scipy.sparse as sparse
+
+default_col_count = 5
+default_row_count = 5
+
+default_reward = -0.1
+default_success = 0.9
+discount = 0.9
+
+class Actions(Enum):
+    NORTH = 0
+    WEST = 1
+    EAST = 2
+    SOUTH = 3
+allowed_actions_count = 4
+
+action_offsets = {
+    Actions.NORTH: (0, -1),
+    Actions.WEST: (-1, 0),
+    Actions.EAST: (1, 0),
+    Actions.SOUTH: (0, 1)
+}
+opposite_actions = {
+    Actions.NORTH: Actions.SOUTH,
+    Actions.WEST: Actions.EAST,
+    Actions.EAST: Actions.WEST,
+    Actions.SOUTH: Actions.NORTH
+}
+
+raster_one_way = {
+    "^": Actions.NORTH,
+    "<": Actions.WEST,
+    ">": Actions.EAST,
+    "v": Actions.SOUTH
+}
+
+class GridShape:
+    def __init__(self, col_count=default_col_count, row_count=default_row_count):
+        if col_count < 1 or row_count < 1:
+            raise ValueError("grid must be at least 1x1, got {}x{}".format(col_count, row_count))
+        self.col_count = col_count
+        self.row_count = row_count
+        self.shape = (row_count, col_count)
+        self.size = col_count * row_count
+
+    def contains(self, col, row):
+        return 0 <= col < self.col_count and 0 <= row < self.row_count
+
+    def index(self, col, row):
+        return np.ravel_multi_index((row, col), self.shape)
+
+    def coords(self, index):
+        row, col = np.unravel_index(index, self.shape)
+        return col, row
+
+    def move(self, index, action):
+        col, row = self.coords(index)
+        col_offset, row_offset = action_offsets[action]
+        return self.index(np.clip(col + col_offset, 0, self.col_count - 1),
+                          np.clip(row + row_offset, 0, self.row_count - 1))
+
+    def pos(self, index):
+        col, row = self.coords(index)
+        return {
+            "col": int(col),
+            "row": int(row),
+            "index": int(index)
+        }
+
+def build_reward(grid):
+    return np.full((grid.size, allowed_actions_count), default_reward)
+
+class RoadNetwork:
+    def __init__(self, grid):
+        self.grid = grid
+        self.blocked = np.zeros(grid.size, dtype=bool)
+        self.success = np.full((allowed_actions_count, grid.size), default_success)
+
+    def block(self, index):
+        self.blocked[index] = True
+
+    def set_cell_success(self, index, probability):
+        self.success[:, index] = probability
+
+    def set_edge_success(self, index, action, probability):
+        self.success[action.value, index] = probability
+
+    def one_way(self, index, action):
+        reverse = opposite_actions[action].value
+        self.success[reverse, index] = 0
+        self.success[reverse, self.grid.move(index, action)] = 0
+
+def load_raster(path):
+    with open(path) as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    if len(set(map(len, lines))) != 1:
+        raise ValueError("raster {} rows must all have the same length".format(path))
+    cells = np.array([list(line) for line in lines])
+    grid = GridShape(cells.shape[1], cells.shape[0])
+    road = RoadNetwork(grid)
+    cells = cells.ravel()
+    unknown = set(cells) - set(".#0123456789") - set(raster_one_way)
+    if unknown:
+        raise ValueError("raster {} has unknown cell symbols {}".format(path, sorted(unknown)))
+    road.block(cells == "#")
+    digits = np.char.isdigit(cells)
+    road.set_cell_success(digits, cells[digits].astype(int) / 10)
+    for symbol, action in raster_one_way.items():
+        road.one_way(np.flatnonzero(cells == symbol), action)
+    return grid, road
+
+def load_edges(path, road):
+    cols, rows, actions, success = [], [], [], []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                col, row, action, probability = line.split(",")
+                col, row = int(col), int(row)
+                action = Actions[action.strip()]
+                probability = float(probability)
+            except (ValueError, KeyError):
+                raise ValueError("{}:{}: expected col,row,action,success, got {!r}".format(path, line_number, line))
+            if not road.grid.contains(col, row):
+                raise ValueError("{}:{}: cell ({}, {}) is outside the {}x{} grid".format(
+                    path, line_number, col, row, road.grid.col_count, road.grid.row_count))
+            if not 0 <= probability <= 1:
+                raise ValueError("{}:{}: success must be between 0 and 1, got {}".format(path, line_number, probability))
+            cols.append(col)
+            rows.append(row)
+            actions.append(action.value)
+            success.append(probability)
+    if cols:
+        road.success[actions, road.grid.index(np.array(cols), np.array(rows))] = success
+    return road
+
+def build_transition(grid, road=None):
+    if road is None:
+        road = RoadNetwork(grid)
+    states = np.arange(grid.size)
+    ahead = np.stack([grid.move(states, action) for action in Actions])
+    success = np.where((ahead != states) & ~road.blocked[states] & ~road.blocked[ahead],
+                       road.success,
+                       0)
+    action_rows = np.arange(allowed_actions_count * grid.size)
+    P = sparse.csr_matrix((np.concatenate((success.ravel(), 1 - success.ravel())),
+                           (np.tile(action_rows, 2),
+                            np.concatenate((ahead.ravel(), np.tile(states, allowed_actions_count))))),
+                          shape=(allowed_actions_count * grid.size, grid.size))
+    P.eliminate_zeros()
+    return [P[action.value * grid.size:(action.value + 1) * grid.size] for action in Actions]
+
+def apply_event(P, pos_index, severity):
+    if not 0 <= severity <= 1:
+        raise ValueError("severity must be between 0 and 1, got {}".format(severity))
+    for action, transition in enumerate(P):
+        transition = transition.tocoo()
+        rows, cols, data = transition.row, transition.col, transition.data
+        entering = np.unique(rows[(cols == pos_index) & (rows != pos_index)])
+        stay = data[(rows == pos_index) & (cols == pos_index)]
+        leaving = len(stay) > 0 and stay[0] != 1
+        exits = cols[(rows == pos_index) & (cols != pos_index) & leaving]
+        affected = np.isin(rows, entering) | ((rows == pos_index) & leaving)
+        pos_rows = np.full(len(exits), pos_index)
+        rows = np.concatenate((rows[~affected], entering, entering, pos_rows, pos_rows))
+        cols = np.concatenate((cols[~affected], np.full(len(entering), pos_index), entering, pos_rows, exits))
+        data = np.concatenate((data[~affected],
+                               np.full(len(entering), 1 - severity),
+                               np.full(len(entering), severity),
+                               np.full(len(exits), severity),
+                               np.full(len(exits), 1 - severity)))
+        P[action] = sparse.csr_matrix((data, (rows, cols)), shape=transition.shape)
+        P[action].eliminate_zeros()
+
+def transition_row(P, pos_index, action):
+    transition = P[action.value]
+    start, end = transition.indptr[pos_index], transition.indptr[pos_index + 1]
+    return transition.indices[start:end], transition.data[start:end]
+
+def apply_reward(R, pos_index, reward):
+    if not np.isfinite(reward):
+        raise ValueError("reward must be finite, got {}".format(reward))
+    R[pos_index, :] = reward
+
+def load_scenario(path):
+    with open(path) as f:
+        scenario = json.load(f)
+    base = os.path.dirname(path)
+    if "raster" in scenario:
+        grid, road = load_raster(os.path.join(base, scenario["raster"]))
+    else:
+        grid = GridShape(scenario.get("cols", default_col_count),
+                         scenario.get("rows", default_row_count))
+        road = RoadNetwork(grid)
+    if "edges" in scenario:
+        load_edges(os.path.join(base, scenario["edges"]), road)
+    P = build_transition(grid, road)
+    R = build_reward(grid)
+    for incident in scenario.get("incidents", []):
+        apply_event(P, grid.index(incident["col"], incident["row"]), incident["severity"])
+    for reward in scenario.get("rewards", []):
+        apply_reward(R, grid.index(reward["col"], reward["row"]), reward["reward"])
+    return scenario, grid, road, P, R
@@ -0,0 +1,200 @@
+import functools
+import json
+
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_linalg
+
+import mdptoolbox.mdp as mdp
+
+from model import allowed_actions_count, discount, apply_event, apply_reward
+
+route_cache_size = 4096
+eta_cache_size = 16
+
+def evaluate(stacked, R, policy):
+    size = len(policy)
+    P_policy = stacked[policy * size + np.arange(size)]
+    return sparse_linalg.spsolve((sparse.identity(size) - discount * P_policy).tocsc(),
+                                 R[np.arange(size), policy])
+
+def improve(Q, policy):
+    current = Q[policy, np.arange(len(policy))]
+    improving = Q.max(axis=0) > current + 1e-9 * np.maximum(1, np.abs(current))
+    return np.where(improving, Q.argmax(axis=0), policy), improving.any()
+
+def solve(P, R):
+    if np.ptp(R.max(axis=1)) == 0:
+        policy = R.argmax(axis=1)
+    else:
+        planner = mdp.ValueIteration(P, R, discount)
+        planner.run()
+        policy = np.array(planner.policy, dtype=int)
+    stacked = sparse.vstack(P).tocsr()
+    size = len(policy)
+    while True:
+        value = evaluate(stacked, R, policy)
+        Q = R.T + discount * stacked.dot(value).reshape(allowed_actions_count, size)
+        policy, improved = improve(Q, policy)
+        if not improved:
+            return policy, value
+
+def closure(P_policy, seed, target):
+    states = seed.copy()
+    while True:
+        grown = states | (P_policy.dot(states.astype(float)) > 0)
+        grown[target] = states[target]
+        if (grown == states).all():
+            return states
+        states = grown
+
+def hitting_time(P_policy, target):
+    size = P_policy.shape[0]
+    seed = np.zeros(size, dtype=bool)
+    seed[target] = True
+    reaching = closure(P_policy, seed, target)
+    stranded = closure(P_policy, ~reaching, target)
+    transient = ~stranded
+    transient[target] = False
+    Q = P_policy[transient][:, transient]
+    eta = np.full(size, np.inf)
+    eta[target] = 0
+    if Q.shape[0]:
+        eta[transient] = sparse_linalg.spsolve(
+            (sparse.identity(Q.shape[0]) - Q).tocsc(), np.ones(Q.shape[0]))
+    return eta
+
+def successors(P_policy):
+    states = np.arange(P_policy.shape[0])
+    moves = P_policy - sparse.diags(P_policy.diagonal())
+    moves.eliminate_zeros()
+    return np.where(moves.max(axis=1).toarray().ravel() > 0,
+                    np.asarray(moves.argmax(axis=1)).ravel(),
+                    states)
+
+def build_epochs(grid, P, R, epochs):
+    compiled = {}
+    schedule = []
+    for epoch in epochs:
+        overlay = {
+            "incidents": epoch.get("incidents", []),
+            "rewards": epoch.get("rewards", [])
+        }
+        key = json.dumps(overlay, sort_keys=True)
+        if key not in compiled:
+            P_epoch = P
+            R_epoch = R
+            if overlay["incidents"]:
+                P_epoch = list(P)
+                for incident in overlay["incidents"]:
+                    apply_event(P_epoch, grid.index(incident["col"], incident["row"]), incident["severity"])
+            if overlay["rewards"]:
+                R_epoch = R.copy()
+                for reward in overlay["rewards"]:
+                    apply_reward(R_epoch, grid.index(reward["col"], reward["row"]), reward["reward"])
+            compiled[key] = (P_epoch, R_epoch)
+        schedule.append((int(epoch["steps"]), compiled[key]))
+    return schedule
+
+def epoch_at(schedule, t):
+    for steps, epoch in schedule:
+        if t < steps:
+            return epoch
+        t -= steps
+    return schedule[-1][1]
+
+class FiniteHorizonPlan:
+    def __init__(self, schedule, solved=None):
+        if not schedule or any(steps < 1 for steps, _ in schedule):
+            raise ValueError("every epoch needs at least one step")
+        self.epochs = []
+        shared = {}
+        epoch_ids = []
+        for steps, (P, R) in schedule:
+            key = (id(P), id(R))
+            if key not in shared:
+                shared[key] = len(self.epochs)
+                self.epochs.append((P, R))
+            epoch_ids += [shared[key]] * steps
+        self.horizon = len(epoch_ids)
+        self.epoch_ids = np.array(epoch_ids + epoch_ids[-1:])
+        self.stacked = [sparse.vstack(P).tocsr() for P, R in self.epochs]
+        self.size = self.epochs[0][1].shape[0]
+
+        P_tail, R_tail = self.epochs[self.epoch_ids[-1]]
+        if solved is not None and solved[0] is P_tail and solved[1] is R_tail:
+            tail_policy, tail_value = solved[2:]
+        else:
+            tail_policy, tail_value = solve(P_tail, R_tail)
+        policies = [tail_policy.astype(np.int8)]
+        policy_ids = [0]
+        self.values = np.empty((self.horizon + 1, self.size))
+        self.values[self.horizon] = tail_value
+        for t in reversed(range(self.horizon)):
+            R = self.epochs[self.epoch_ids[t]][1]
+            Q = R.T + discount * self.stacked[self.epoch_ids[t]].dot(self.values[t + 1]).reshape(allowed_actions_count, self.size)
+            policy = improve(Q, policies[-1])[0].astype(np.int8)
+            if not np.array_equal(policy, policies[-1]):
+                policies.append(policy)
+            policy_ids.append(len(policies) - 1)
+            self.values[t] = Q.max(axis=0)
+        self.policies = np.array(policies)
+        self.policy_ids = np.array(policy_ids[::-1])
+
+        self.P_policy_cache = {}
+        self.successor_cache = {}
+        self.route_steps = functools.lru_cache(maxsize=route_cache_size)(self.expand_route)
+        self.eta = functools.lru_cache(maxsize=eta_cache_size)(self.eta_table)
+
+    def step(self, t):
+        if np.ndim(t):
+            return np.minimum(t, self.horizon)
+        return min(t, self.horizon)
+
+    def action(self, index, t):
+        return self.policies[self.policy_ids[self.step(t)], index]
+
+    def value(self, index, t):
+        return self.values[self.step(t), index]
+
+    def transition(self, t):
+        return self.epochs[self.epoch_ids[self.step(t)]][0]
+
+    def policy_transition(self, t):
+        t = self.step(t)
+        key = (self.epoch_ids[t], self.policy_ids[t])
+        if key not in self.P_policy_cache:
+            policy = self.policies[self.policy_ids[t]].astype(int)
+            self.P_policy_cache[key] = self.stacked[key[0]][policy * self.size + np.arange(self.size)]
+        return self.P_policy_cache[key]
+
+    def successor(self, index, t):
+        t = self.step(t)
+        key = (self.epoch_ids[t], self.policy_ids[t])
+        if key not in self.successor_cache:
+            self.successor_cache[key] = successors(self.policy_transition(t))
+        return int(self.successor_cache[key][index])
+
+    def expand_route(self, index, target, t):
+        route = [index]
+        visited = {(index, t)}
+        while index != target:
+            index = self.successor(index, t)
+            t = int(self.step(t + 1))
+            if (index, t) in visited:
+                break
+            route.append(index)
+            visited.add((index, t))
+        return route
+
+    def route(self, index, target, t):
+        route = self.route_steps(index, target, int(self.step(t)))
+        return [(step, t + offset) for offset, step in enumerate(route)]
+
+    def eta_table(self, target):
+        eta = np.empty((self.horizon + 1, self.size))
+        eta[self.horizon] = hitting_time(self.policy_transition(self.horizon), target)
+        for t in reversed(range(self.horizon)):
+            eta[t] = 1 + self.policy_transition(t).dot(eta[t + 1])
+            eta[t, target] = 0
+        return eta
@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sparse
+
+from model import (Actions, GridShape, build_reward, build_transition,
+                   apply_event, apply_reward, load_scenario)
+from planner import (solve, hitting_time, successors, build_epochs, FiniteHorizonPlan,
+                     route_cache_size, eta_cache_size)
+
+default_host = "127.0.0.1"
+default_port = 8765
+
+def answer(future, response):
+    if not future.done():
+        future.set_result(response)
+
+class PolicySnapshot:
+    def __init__(self, grid, P, R, version, epochs=None):
+        self.grid = grid
+        self.P = P
+        self.R = R
+        self.version = version
+        self.policy, self.value = solve(P, R)
+        self.P_policy = sparse.vstack(P).tocsr()[self.policy * grid.size + np.arange(grid.size)]
+        self.successor = successors(self.P_policy)
+        self.plan = None
+        if epochs:
+            self.plan = FiniteHorizonPlan(build_epochs(grid, P, R, epochs),
+                                          (P, R, self.policy, self.value))
+        self.route = functools.lru_cache(maxsize=route_cache_size)(self.expand_route)
+        self.eta = functools.lru_cache(maxsize=eta_cache_size)(self.hitting_time)
+
+    def expand_route(self, index, target):
+        route = [index]
+        visited = {index}
+        while index != target:
+            index = int(self.successor[index])
+            if index in visited:
+                break
+            route.append(index)
+            visited.add(index)
+        return route
+
+    def hitting_time(self, target):
+        return hitting_time(self.P_policy, target)
+
+class PolicyService:
+    def __init__(self, grid, P, R, default_target=None, epochs=None):
+        self.grid = grid
+        self.P = P
+        self.R = R
+        self.default_target = default_target
+        self.epochs = epochs
+        self.version = 0
+        self.snapshot = PolicySnapshot(grid, P.copy(), R.copy(), self.version, epochs)
+        self.pending = []
+        self.solving = None
+        self.solve_error = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def parse_pos(self, pos):
+        col = int(pos["col"])
+        row = int(pos["row"])
+        if not self.grid.contains(col, row):
+            raise ValueError("position ({}, {}) is outside the grid".format(col, row))
+        return int(self.grid.index(col, row))
+
+    def parse_target(self, request):
+        if "to" in request:
+            return self.parse_pos(request["to"])
+        if self.default_target is None:
+            raise ValueError("no destination given and scenario has no default")
+        return self.default_target
+
+    async def dispatch(self, request):
+        query = request.get("query")
+        try:
+            if query in ("action", "route", "eta"):
+                return await self.lookup(request)
+            if query == "incident":
+                apply_event(self.P, self.parse_pos(request), float(request["severity"]))
+                return self.request_solve()
+            if query == "reward":
+                apply_reward(self.R, self.parse_pos(request), float(request["reward"]))
+                return self.request_solve()
+            if query == "status":
+                return {
+                    "version": self.version,
+                    "solved_version": self.snapshot.version,
+                    "last_solve_error": self.solve_error
+                }
+            raise ValueError("unknown query {!r}".format(query))
+        except (KeyError, TypeError, ValueError, OverflowError) as e:
+            return {"error": str(e)}
+
+    def lookup(self, request):
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append((request, future))
+        if len(self.pending) == 1:
+            asyncio.get_event_loop().call_soon(self.flush)
+        return future
+
+    def parse_time(self, request, snapshot):
+        if "time" not in request:
+            return None
+        if snapshot.plan is None:
+            raise ValueError("scenario has no epochs to plan departure times against")
+        time = int(request["time"])
+        if time < 0:
+            raise ValueError("time must not be negative, got {}".format(time))
+        return min(time, snapshot.plan.horizon)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        snapshot = self.snapshot
+        batch = []
+        for request, future in pending:
+            try:
+                index = self.parse_pos(request)
+                target = self.parse_target(request) if request["query"] != "action" else None
+                time = self.parse_time(request, snapshot)
+            except (KeyError, TypeError, ValueError, OverflowError) as e:
+                answer(future, {"error": str(e)})
+                continue
+            batch.append((request, future, index, target, time))
+        try:
+            self.answer_batch(snapshot, batch)
+        except Exception as e:
+            for request, future, index, target, time in batch:
+                answer(future, {"error": "{}: {}".format(type(e).__name__, e)})
+
+    def answer_batch(self, snapshot, batch):
+        if not batch:
+            return
+        indices = np.array([item[2] for item in batch])
+        targets = np.array([-1 if item[3] is None else item[3] for item in batch])
+        times = np.array([-1 if item[4] is None else item[4] for item in batch])
+        timed = times >= 0
+        actions = snapshot.policy[indices]
+        values = snapshot.value[indices]
+        if timed.any():
+            actions[timed] = snapshot.plan.action(indices[timed], times[timed])
+            values[timed] = snapshot.plan.value(indices[timed], times[timed])
+        etas = np.full(len(batch), np.inf)
+        for target in np.unique(targets[targets >= 0]):
+            mask = (targets == target) & ~timed
+            etas[mask] = snapshot.eta(int(target))[indices[mask]]
+            mask = (targets == target) & timed
+            if mask.any():
+                etas[mask] = snapshot.plan.eta(int(target))[snapshot.plan.step(times[mask]), indices[mask]]
+        for i, (request, future, index, target, time) in enumerate(batch):
+            response = {
+                "version": snapshot.version,
+                "action": Actions(actions[i]).name,
+                "value": float(values[i])
+            }
+            if request["query"] in ("route", "eta"):
+                response["eta"] = None if np.isinf(etas[i]) else float(etas[i])
+            if request["query"] == "route":
+                if time is None:
+                    route = snapshot.route(index, target)
+                    response["route"] = [dict(snapshot.grid.pos(step),
+                                              action=None if step == target else Actions(snapshot.policy[step]).name)
+                                         for step in route]
+                else:
+                    route = snapshot.plan.route(index, target, time)
+                    departure = int(request["time"])
+                    response["route"] = [dict(snapshot.grid.pos(step),
+                                              time=departure + t - time,
+                                              action=None if step == target else Actions(snapshot.plan.action(step, t)).name)
+                                         for step, t in route]
+                    route = [step for step, t in route]
+                response["arrived"] = route[-1] == target
+            answer(future, response)
+
+    def request_solve(self):
+        self.version += 1
+        if self.solving is None or self.solving.done():
+            self.solving = asyncio.ensure_future(self.resolve())
+        return {"version": self.version}
+
+    async def resolve(self):
+        loop = asyncio.get_event_loop()
+        while self.snapshot.version != self.version:
+            version = self.version
+            try:
+                self.snapshot = await loop.run_in_executor(self.executor,
+                                                           PolicySnapshot,
+                                                           self.grid,
+                                                           self.P.copy(),
+                                                           self.R.copy(),
+                                                           version,
+                                                           self.epochs)
+            except Exception as e:
+                self.solve_error = {
+                    "message": "{}: {}".format(type(e).__name__, e),
+                    "rolled_back": [self.snapshot.version + 1, self.version]
+                }
+                self.P = list(self.snapshot.P)
+                self.R = self.snapshot.R.copy()
+                self.version += 1
+                self.snapshot.version = self.version
+
+    async def respond(self, request, writer):
+        response = await self.dispatch(request)
+        if "id" in request:
+            response["id"] = request["id"]
+        writer.write((json.dumps(response) + "\n").encode())
+
+    async def handle(self, reader, writer):
+        tasks = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line.decode())
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                writer.write((json.dumps({"error": "malformed request"}) + "\n").encode())
+                continue
+            task = asyncio.ensure_future(self.respond(request, writer))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if len(tasks) > 1024:
+                await writer.drain()
+        if tasks:
+            await asyncio.gather(*tasks)
+        await writer.drain()
+        writer.close()
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(service.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve MDP taxi routing queries over a local socket.")
+    parser.add_argument("scenario", nargs="?", help="scenario JSON with incidents, rewards, dest and epochs")
+    parser.add_argument("--host", default=default_host)
+    parser.add_argument("--port", type=int, default=default_port)
+    args = parser.parse_args()
+
+    default_target = None
+    scenario = {}
+    if args.scenario:
+        scenario, grid, road, P, R = load_scenario(args.scenario)
+        if "dest" in scenario:
+            default_target = int(grid.index(scenario["dest"]["col"], scenario["dest"]["row"]))
+    else:
+        grid = GridShape()
+        P = build_transition(grid)
+        R = build_reward(grid)
+
+    service = PolicyService(grid, P, R, default_target, scenario.get("epochs"))
+    print("Serving routing queries on {}:{}".format(args.host, args.port))
+    asyncio.run(serve(service, args.host, args.port))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+import scipy.sparse as sparse
+
+from model import (Actions, GridShape, RoadNetwork, allowed_actions_count,
+                   build_transition, apply_event, load_edges, transition_row)
+
+def dense_transition(col_count, row_count):
+    grid_map_size = col_count * row_count
+    P = np.zeros((allowed_actions_count, grid_map_size, grid_map_size))
+    P[Actions.NORTH.value] = np.vstack(
+                                (np.eye(N=col_count,
+                                        M=grid_map_size),
+                                 np.eye(N=(grid_map_size-col_count),
+                                        M=grid_map_size)))
+    P[Actions.EAST.value] = sparse.block_diag(
+                                [np.pad(
+                                    np.eye(N=(col_count-1),
+                                           M=col_count,
+                                           k=1),
+                                    ((0, 1), (0, 0)),
+                                    'edge')
+                                ]*row_count).toarray()
+    P[Actions.WEST.value] = np.flip(P[Actions.EAST.value], (0, 1))
+    P[Actions.SOUTH.value] = np.flip(P[Actions.NORTH.value], (0, 1))
+    P *= 0.9
+    stationary_transition = np.repeat(np.identity(grid_map_size)[:, :, np.newaxis],
+                                      allowed_actions_count,
+                                      axis=2).T * 0.1
+    P += stationary_transition
+    return P
+
+def dense_event(P, pos_index, severity):
+    active_index = np.array(np.nonzero(P[:, :, pos_index]))
+    ext_active_index = active_index[:, active_index[1] != pos_index]
+    int_active_index = active_index[:,
+                                    np.logical_and(
+                                        active_index[1] == pos_index,
+                                        P[active_index[0],
+                                          active_index[1],
+                                          active_index[1]] != 1)]
+    int_row_nonzero_index = np.array(np.nonzero(P[int_active_index[0], int_active_index[1], :]))
+    int_secondary_index = int_row_nonzero_index[1, int_row_nonzero_index[1] != pos_index]
+    P[ext_active_index[0], ext_active_index[1], pos_index] = 1 - severity
+    P[ext_active_index[0], ext_active_index[1], ext_active_index[1]] = severity
+    P[int_active_index[0], int_active_index[1], pos_index] = severity
+    P[int_active_index[0], int_active_index[1], int_secondary_index] = 1 - severity
+
+def assert_same(dense, P):
+    for action in Actions:
+        np.testing.assert_allclose(P[action.value].toarray(), dense[action.value])
+
+@pytest.mark.parametrize("col_count, row_count", [(5, 5), (7, 3), (2, 6)])
+def test_build_transition_matches_dense(col_count, row_count):
+    assert_same(dense_transition(col_count, row_count),
+                build_transition(GridShape(col_count, row_count)))
+
+def test_apply_event_skips_own_row_once_stay_is_zero():
+    dense = dense_transition(5, 5)
+    P = build_transition(GridShape())
+    for pos_index, severity in [(21, .7), (12, .3), (7, 0), (1, 0), (4, 1), (16, 1), (12, .7)]:
+        dense_event(dense, pos_index, severity)
+        apply_event(P, pos_index, severity)
+        assert_same(dense, P)
+    assert dict(zip(*transition_row(P, 12, Actions.NORTH))) == {7: 1.0}
+
+@pytest.mark.parametrize("seed", range(20))
+def test_apply_event_matches_dense(seed):
+    random = np.random.RandomState(seed)
+    col_count, row_count = random.randint(2, 7), random.randint(1, 7)
+    dense = dense_transition(col_count, row_count)
+    P = build_transition(GridShape(col_count, row_count))
+    for _ in range(12):
+        pos_index = random.randint(col_count * row_count)
+        severity = random.choice([0, 1, round(random.rand(), 2)])
+        dense_event(dense, pos_index, severity)
+        apply_event(P, pos_index, severity)
+        assert_same(dense, P)
+
+def test_apply_event_rejects_severity_out_of_range():
+    P = build_transition(GridShape())
+    with pytest.raises(ValueError):
+        apply_event(P, 0, 5)
+
+def test_one_way_only_forbids_reverse_moves():
+    grid = GridShape(3, 3)
+    road = RoadNetwork(grid)
+    road.one_way(4, Actions.EAST)
+    P = build_transition(grid, road)
+    assert dict(zip(*transition_row(P, 4, Actions.WEST))) == {4: 1.0}
+    assert dict(zip(*transition_row(P, 5, Actions.WEST))) == {5: 1.0}
+    assert dict(zip(*transition_row(P, 4, Actions.NORTH))) == pytest.approx({1: 0.9, 4: 0.1})
+    assert dict(zip(*transition_row(P, 4, Actions.SOUTH))) == pytest.approx({7: 0.9, 4: 0.1})
+
+@pytest.mark.parametrize("line, message", [
+    ("0,0,EAST,1.5", ":2: success must be between 0 and 1"),
+    ("9,0,EAST,0.5", ":2: cell (9, 0) is outside"),
+    ("0,0,UP,0.5", ":2: expected col,row,action,success")
+])
+def test_load_edges_rejects_bad_rows(tmp_path, line, message):
+    path = tmp_path / "edges.csv"
+    path.write_text("# col,row,action,success\n" + line + "\n")
+    with pytest.raises(ValueError) as error:
+        load_edges(str(path), RoadNetwork(GridShape()))
+    assert message in str(error.value)
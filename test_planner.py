@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import mdptoolbox.mdp as mdp
+
+from model import GridShape, build_reward, build_transition, apply_event, discount
+from planner import solve, build_epochs, epoch_at, FiniteHorizonPlan
+
+def scenario():
+    grid = GridShape(6, 4)
+    R = build_reward(grid)
+    R[grid.size - 1, :] = 10
+    return grid, build_transition(grid), R
+
+def reference(P, R):
+    planner = mdp.PolicyIteration([transition.toarray() for transition in P], R, discount)
+    planner.run()
+    return np.array(planner.policy), np.array(planner.V)
+
+@pytest.mark.parametrize("col_count, row_count", [(5, 5), (6, 4), (3, 7)])
+def test_solve_matches_policy_iteration(col_count, row_count):
+    grid = GridShape(col_count, row_count)
+    P = build_transition(grid)
+    R = build_reward(grid)
+    R[grid.size - 1, :] = 10
+    apply_event(P, grid.index(1, 1), 0.2)
+    policy, value = solve(P, R)
+    expected_policy, expected_value = reference(P, R)
+    np.testing.assert_allclose(value, expected_value, rtol=1e-6)
+    np.testing.assert_array_equal(policy, expected_policy)
+
+def test_solve_handles_uniform_rewards():
+    grid = GridShape()
+    P = build_transition(grid)
+    R = build_reward(grid)
+    policy, value = solve(P, R)
+    expected_policy, expected_value = reference(P, R)
+    np.testing.assert_allclose(value, expected_value, rtol=1e-6)
+    np.testing.assert_allclose(value, R[0, 0] / (1 - discount))
+    np.testing.assert_array_equal(policy, expected_policy)
+
+def test_base_epochs_follow_the_stationary_plan():
+    grid, P, R = scenario()
+    policy, value = solve(P, R)
+    plan = FiniteHorizonPlan(build_epochs(grid, P, R, [{"steps": 3}, {"steps": 2}]))
+    for t in range(plan.horizon + 2):
+        np.testing.assert_array_equal(plan.action(np.arange(grid.size), t), policy)
+        np.testing.assert_allclose(plan.value(np.arange(grid.size), t), value, rtol=1e-9)
+
+def test_identical_overlays_share_transitions_and_rewards():
+    grid, P, R = scenario()
+    rush = {"incidents": [{"col": 2, "row": 1, "severity": 0.2}]}
+    schedule = build_epochs(grid, P, R, [dict(rush, steps=2), {"steps": 1}, dict(rush, steps=3)])
+    assert schedule[0][1] is schedule[2][1]
+    assert schedule[0][1][1] is R
+    assert schedule[1][1][0] is P and schedule[1][1][1] is R
+    assert len(FiniteHorizonPlan(schedule).epochs) == 2
+
+def test_step_clamps_past_the_horizon():
+    grid, P, R = scenario()
+    rush = {"incidents": [{"col": 2, "row": 1, "severity": 0.2}]}
+    schedule = build_epochs(grid, P, R, [dict(rush, steps=2), {"steps": 3}])
+    plan = FiniteHorizonPlan(schedule)
+    assert plan.horizon == 5
+    assert plan.step(3) == 3
+    assert plan.step(10 ** 30) == plan.horizon
+    assert plan.transition(10 ** 30) is P is epoch_at(schedule, 10 ** 30)[0]
+    assert plan.value(0, 10 ** 30) == plan.value(0, plan.horizon)
+    route = plan.route(0, grid.size - 1, 10 ** 30)
+    assert [t for _, t in route] == list(range(10 ** 30, 10 ** 30 + len(route)))
+    assert [index for index, _ in route] == [index for index, _ in plan.route(0, grid.size - 1, plan.horizon)]
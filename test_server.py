@@ -0,0 +1,33 @@
+import asyncio
+import json
+
+from model import GridShape, build_reward, build_transition
+from server import PolicyService
+
+def exchange(service, requests):
+    async def run():
+        server = await asyncio.start_server(service.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write("".join(json.dumps(request) + "\n" for request in requests).encode())
+        await writer.drain()
+        responses = [json.loads(await asyncio.wait_for(reader.readline(), 5)) for _ in requests]
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return {response["id"]: response for response in responses}
+    return asyncio.run(run())
+
+def test_non_finite_numbers_do_not_drop_batched_queries():
+    grid = GridShape()
+    service = PolicyService(grid, build_transition(grid), build_reward(grid), default_target=24)
+    responses = exchange(service, [
+        {"id": 1, "query": "action", "col": 1e400, "row": 0},
+        {"id": 2, "query": "eta", "col": 1, "row": 0},
+        {"id": 3, "query": "incident", "col": 0, "row": -1e400, "severity": 0.5},
+        {"id": 4, "query": "status"}
+    ])
+    assert "error" in responses[1]
+    assert responses[2]["action"] in ("NORTH", "WEST", "EAST", "SOUTH")
+    assert "error" in responses[3]
+    assert responses[4]["version"] == 0
@@ -1,14 +1,20 @@
 import sys
-from enum import Enum
+import json
+import argparse
 
 import numpy as np
-import scipy.sparse as sparse
 
 import mdptoolbox.mdp as mdp
 
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
+
+from model import (Actions, GridShape, RoadNetwork, default_col_count,
+                   default_row_count, default_reward, discount, build_reward,
+                   build_transition, apply_event, apply_reward, load_raster,
+                   load_edges, transition_row)
+from planner import build_epochs, epoch_at, FiniteHorizonPlan
         
 grid_width = 800
 grid_height = 800
@@ -16,24 +22,16 @@ window_width = 1000
 window_height = 800
 block_size = 0
 
-col_count = 5
-row_count = 5
-grid_map_size = col_count * row_count
-
-default_reward = -0.1
-
-class Actions(Enum):
-    NORTH = 0
-    WEST = 1
-    EAST = 2
-    SOUTH = 3
-allowed_actions_count = 4
-
+grid_shape = None
+road = None
 driver = None
 client = None
 dest = None
 R = None
 P = None
+epochs = None
+schedule = None
+plan = None
 
 def initData():
     global driver
@@ -41,6 +39,8 @@ def initData():
     global dest
     global R
     global P
+    global schedule
+    global plan
     driver = {
         "col": 0,
         "row": 0,
@@ -56,66 +56,36 @@ def initData():
         "row": 0,
         "index": 0
     }
-    R = np.full((grid_map_size, allowed_actions_count), default_reward)
-    P = np.zeros((allowed_actions_count, grid_map_size, grid_map_size))
-    P[Actions.NORTH.value] = np.vstack(
-                                (np.eye(N=col_count,
-                                        M=grid_map_size),
-                                 np.eye(N=(grid_map_size-col_count),
-                                        M=grid_map_size)))
-    P[Actions.EAST.value] = sparse.block_diag(
-                                [np.pad(
-                                    np.eye(N=(col_count-1),
-                                           M=col_count,
-                                           k=1),
-                                    ((0, 1), (0, 0)),
-                                    'edge')
-                                ]*row_count).toarray()
-    P[Actions.WEST.value] = np.flip(P[Actions.EAST.value], (0, 1))
-    P[Actions.SOUTH.value] = np.flip(P[Actions.NORTH.value], (0, 1))
-    P *= 0.9
-    stationary_transition = np.repeat(np.identity(grid_map_size)[:, :, np.newaxis],
-                                      allowed_actions_count,
-                                      axis=2).T * 0.1
-    P += stationary_transition
+    R = build_reward(grid_shape)
+    P = build_transition(grid_shape, road)
+    schedule = None
+    plan = None
     
 def update_event(pos_index, severity):
-    global P
-    active_index = np.array(
-                        np.nonzero(
-                            P[:,
-                              :,
-                              pos_index]))
-    ext_active_index = active_index[:, 
-                                    active_index[1] != pos_index]
-    int_active_index = active_index[:, 
-                                    np.logical_and(
-                                        active_index[1] == pos_index, 
-                                        P[active_index[0], 
-                                          active_index[1], 
-                                          active_index[1]] != 1)]
-    int_row_nonzero_index = np.array(
-                                np.nonzero(
-                                    P[int_active_index[0], 
-                                      int_active_index[1], 
-                                      :]))
-    int_secondary_index = int_row_nonzero_index[1, int_row_nonzero_index[1] != pos_index]
-    P[ext_active_index[0], 
-      ext_active_index[1], 
-      pos_index] = 1 - severity
-    P[ext_active_index[0], 
-      ext_active_index[1], 
-      ext_active_index[1]] = severity
-    P[int_active_index[0], 
-      int_active_index[1], 
-      pos_index] = severity
-    P[int_active_index[0], 
-      int_active_index[1], 
-      int_secondary_index] = 1 - severity
+    global schedule
+    global plan
+    apply_event(P, pos_index, severity)
+    schedule = None
+    plan = None
 
 def update_reward(pos_index, reward):
-    global R
-    R[pos_index, :] = reward
+    global schedule
+    global plan
+    apply_reward(R, pos_index, reward)
+    schedule = None
+    plan = None
+
+def get_schedule():
+    global schedule
+    if schedule is None:
+        schedule = build_epochs(grid_shape, P, R, epochs)
+    return schedule
+
+def get_plan():
+    global plan
+    if plan is None:
+        plan = FiniteHorizonPlan(get_schedule())
+    return plan
     
 class SimulationSetting(QWidget):
     simulationRan = pyqtSignal(dict)
@@ -130,6 +100,7 @@ class SimulationSetting(QWidget):
         self.isShowReward = True
         self.isShowTransition = False
         self.actionType = Actions.NORTH
+        self.shownTransition = {}
 
         self.runBtn = None
         self.stepsCounter = None
@@ -180,17 +151,19 @@ class SimulationSetting(QWidget):
         self.setLayout(layout)
     
     def run_simulation(self, *args, **kwargs):
-        mdp_planner = mdp.PolicyIteration(P, R, 0.9)
-        mdp_planner.run()
-        mdp_policy = mdp_planner.policy
-        driver_policy = mdp_policy[driver["index"]]
+        if epochs:
+            driver_policy = get_plan().action(driver["index"], self.steps)
+            transition = plan.transition(self.steps)
+        else:
+            mdp_planner = mdp.PolicyIteration(P, R, discount)
+            mdp_planner.run()
+            mdp_policy = mdp_planner.policy
+            driver_policy = mdp_policy[driver["index"]]
+            transition = P
         action = Actions(driver_policy)
-        ideal_dest = {
-            "col": driver["col"] + 1 if action is Actions.EAST and driver["col"] != (col_count - 1) else driver["col"] - 1 if action is Actions.WEST and driver["col"] != 0 else driver["col"],
-            "row": driver["row"] + 1 if action is Actions.SOUTH and driver["row"] != (row_count - 1) else driver["row"] - 1 if action is Actions.NORTH and driver["row"] != 0 else driver["row"]
-        }
-        ideal_dest_index = (row_count * ideal_dest["row"]) + ideal_dest["col"]
-        action_prob = P[action.value, driver["index"], ideal_dest_index]
+        ideal_dest = grid_shape.pos(grid_shape.move(driver["index"], action))
+        ideal_dest_index = ideal_dest["index"]
+        action_prob = transition[action.value][driver["index"], ideal_dest_index]
         policy_succeed = np.random.choice([0,1], 1, p=[1 - action_prob, action_prob])[0]
         self.simulation_detail = {
             "action": action,
@@ -224,19 +197,28 @@ class SimulationSetting(QWidget):
     def show_reward(self, *args, **kwargs):
         if self.showTransitionRadio.isChecked():
             return
+        self.isShowReward = True
+        self.isShowTransition = False
+        self.shownTransition = {}
         self.showReward.emit()
         
     def show_transition(self, *args, **kwargs):
         if self.showRewardRadio.isChecked():
             return
         action = Actions[self.actionTransitionTypeCombobox.currentText()]
-        action_index = action.value
-        transition_array = P[action_index, driver["index"]]
+        transition = epoch_at(get_schedule(), self.steps)[0] if epochs else P
+        successor_index, successor_prob = transition_row(transition, driver["index"], action)
+        transition = dict(zip(successor_index.tolist(), np.round(successor_prob, 6).tolist()))
         self.transition_details = {
-            "probability_array": transition_array,
+            "probability": transition,
+            "cleared": [index for index in self.shownTransition if index not in transition],
+            "refresh": not self.isShowTransition,
             "action": action,
             "source": driver
         }
+        self.isShowReward = False
+        self.isShowTransition = True
+        self.shownTransition = transition
         self.showTransition.emit(self.transition_details)
         
     def reset(self):
@@ -245,6 +227,7 @@ class SimulationSetting(QWidget):
         self.isArrivedDest = False
         self.isShowReward = True
         self.isShowTransition = False
+        self.shownTransition = {}
         
         self.stepsCounter.setText(str(self.steps))
         self.pickedUpStatus.setText(str(self.isPickedUp))
@@ -311,13 +294,13 @@ class PosSetting(QWidget):
         fl = QFormLayout()
         
         self.col = QLineEdit()
-        self.col.setValidator(QIntValidator(0, col_count - 1))
-        self.col.setPlaceholderText("Integer {} - {}".format(0, col_count - 1))
+        self.col.setValidator(QIntValidator(0, grid_shape.col_count - 1))
+        self.col.setPlaceholderText("Integer {} - {}".format(0, grid_shape.col_count - 1))
         self.col.textChanged.connect(self.col_val_changed)
         
         self.row = QLineEdit()
-        self.row.setValidator(QIntValidator(0, row_count - 1))
-        self.row.setPlaceholderText("Integer {} - {}".format(0, row_count - 1))
+        self.row.setValidator(QIntValidator(0, grid_shape.row_count - 1))
+        self.row.setPlaceholderText("Integer {} - {}".format(0, grid_shape.row_count - 1))
         self.row.textChanged.connect(self.row_val_changed)
         
         fl.addRow(QLabel("Column"), self.col)
@@ -373,12 +356,12 @@ class IncidentSetting(QWidget):
         self.severity.setPlaceholderText("Number {} - {}".format(0.0, 1.0))
         
         self.col = QLineEdit()
-        self.col.setValidator(QIntValidator(0, col_count - 1))
-        self.col.setPlaceholderText("Integer {} - {}".format(0, col_count - 1))
+        self.col.setValidator(QIntValidator(0, grid_shape.col_count - 1))
+        self.col.setPlaceholderText("Integer {} - {}".format(0, grid_shape.col_count - 1))
         
         self.row = QLineEdit()
-        self.row.setValidator(QIntValidator(0, row_count - 1))
-        self.row.setPlaceholderText("Integer {} - {}".format(0, row_count - 1))
+        self.row.setValidator(QIntValidator(0, grid_shape.row_count - 1))
+        self.row.setPlaceholderText("Integer {} - {}".format(0, grid_shape.row_count - 1))
         
         self.addBtn = QPushButton("Add")
         self.addBtn.clicked.connect(self.addIncident)
@@ -411,7 +394,7 @@ class IncidentSetting(QWidget):
             "col": int(self.col.text()),
             "row": int(self.row.text())
         }
-        index = (row_count * self.incidentDetail["row"]) + self.incidentDetail["col"]
+        index = grid_shape.index(self.incidentDetail["col"], self.incidentDetail["row"])
         self.incidentDetails.append(self.incidentDetail)
         newRowIndex = self.tableRecord.rowCount()
         self.tableRecord.insertRow(newRowIndex)
@@ -449,24 +432,23 @@ class RewardSetting(QWidget):
         self.reward.setPlaceholderText("Number {} - {}".format(0.0, 1000.0))
         
         self.col = QLineEdit()
-        self.col.setValidator(QIntValidator(0, col_count - 1))
-        self.col.setPlaceholderText("Integer {} - {}".format(0, col_count - 1))
+        self.col.setValidator(QIntValidator(0, grid_shape.col_count - 1))
+        self.col.setPlaceholderText("Integer {} - {}".format(0, grid_shape.col_count - 1))
         
         self.row = QLineEdit()
-        self.row.setValidator(QIntValidator(0, row_count - 1))
-        self.row.setPlaceholderText("Integer {} - {}".format(0, row_count - 1))
+        self.row.setValidator(QIntValidator(0, grid_shape.row_count - 1))
+        self.row.setPlaceholderText("Integer {} - {}".format(0, grid_shape.row_count - 1))
         
         self.addBtn = QPushButton("Add")
         self.addBtn.clicked.connect(self.addReward)
         
-        self.tableRecord = QTableWidget(grid_map_size, 3)
+        self.tableRecord = QTableWidget(grid_shape.size, 3)
         self.tableRecord.setHorizontalHeaderLabels(["Reward", "Col", "Row"]) 
-        positions = [(i,j) for i in range(row_count) for j in range(col_count)]
-        for position in positions:
-            array_index = (row_count * position[0]) + position[1]
+        for array_index in range(grid_shape.size):
+            position = grid_shape.pos(array_index)
             self.tableRecord.setItem(array_index, 0, QTableWidgetItem(str(R[array_index, 0])))
-            self.tableRecord.setItem(array_index, 1, QTableWidgetItem(str(position[1])))
-            self.tableRecord.setItem(array_index, 2, QTableWidgetItem(str(position[0])))
+            self.tableRecord.setItem(array_index, 1, QTableWidgetItem(str(position["col"])))
+            self.tableRecord.setItem(array_index, 2, QTableWidgetItem(str(position["row"])))
 
         fl.addRow(QLabel("Reward"), self.reward)
         fl.addRow(QLabel("Column"), self.col)
@@ -490,7 +472,7 @@ class RewardSetting(QWidget):
             "col": int(self.col.text()),
             "row": int(self.row.text())
         }
-        item_index = (row_count * self.rewardDetail["row"]) + self.rewardDetail["col"]
+        item_index = grid_shape.index(self.rewardDetail["col"], self.rewardDetail["row"])
         update_reward(item_index, self.rewardDetail["reward"])
         self.tableRecord.setItem(item_index, 0, QTableWidgetItem(str(self.rewardDetail["reward"])))
         self.rewardAdded.emit(self.rewardDetail)
@@ -515,7 +497,7 @@ class Settings(QWidget):
         driver = {
             "col": pos["col"],
             "row": pos["row"],
-            "index": (row_count * pos["row"]) + pos["col"]
+            "index": grid_shape.index(pos["col"], pos["row"])
         }
         
     def clientPosChanged(self, pos):
@@ -523,7 +505,7 @@ class Settings(QWidget):
         client = {
             "col": pos["col"],
             "row": pos["row"],
-            "index": (row_count * pos["row"]) + pos["col"]
+            "index": grid_shape.index(pos["col"], pos["row"])
         }
         
     def destPosChanged(self, pos):
@@ -531,7 +513,7 @@ class Settings(QWidget):
         dest = {
             "col": pos["col"],
             "row": pos["row"],
-            "index": (row_count * pos["row"]) + pos["col"]
+            "index": grid_shape.index(pos["col"], pos["row"])
         }
         
     def initUI(self):
@@ -578,7 +560,7 @@ class Pos(QWidget):
         self.height = height
         self.x = x
         self.y = y
-        self.currentIndex = (row_count * self.y) + self.x
+        self.currentIndex = grid_shape.index(self.x, self.y)
         self.isShowReward = True
         self.isShowTransition = False
         self.reward = default_reward
@@ -588,6 +570,7 @@ class Pos(QWidget):
         self.isDest = False
         self.isIncident = False
         self.isPast = False
+        self.isBlocked = road.blocked[self.currentIndex]
 
     def paintEvent(self, event):
         p = QPainter()
@@ -598,6 +581,7 @@ class Pos(QWidget):
                                        else Qt.green if self.isDest
                                        else Qt.red if self.isIncident
                                        else Qt.black if  self.isPast
+                                       else Qt.darkGray if self.isBlocked
                                        else Qt.lightGray ))
         p.setPen(Qt.black if not self.isPast else Qt.white)
         p.setFont(QFont("Arial", self.width * 0.3, 0, False))
@@ -674,10 +658,8 @@ class Pos(QWidget):
         self.isShowTransition = False
         self.update()
 
-    @pyqtSlot(dict)
-    def showTransition(self, *args, **kwargs):
-        transitionDetail = self.sender().transition_details
-        self.transition_prob = transitionDetail["probability_array"][self.currentIndex]
+    def showTransition(self, probability):
+        self.transition_prob = probability
         self.isShowReward = False
         self.isShowTransition = True
         self.update()
@@ -698,6 +680,7 @@ class Grid(QWidget):
     def __init__(self, settings_widget):
         super().__init__()
         self.settings_widget = settings_widget
+        self.cells = []
         self.initUI()
         
     def initUI(self):
@@ -705,26 +688,35 @@ class Grid(QWidget):
         grid = QGridLayout()
         self.setLayout(grid)
         
-        if (row_count >= col_count):
-            block_size = (grid_height / row_count) - 4
-        else:
-            block_size = (grid_width / col_count) - 4
+        block_size = max(min(grid_height / grid_shape.row_count, grid_width / grid_shape.col_count) - 4, 1)
  
-        positions = [(i,j) for i in range(row_count) for j in range(col_count)]
+        positions = [(i,j) for i in range(grid_shape.row_count) for j in range(grid_shape.col_count)]
         for position in positions:
             w = Pos(position[1], position[0], block_size, block_size)
             self.settings_widget.simulation.simulationRan.connect(w.updateSimulationResult)
             self.settings_widget.simulation.showReward.connect(w.showReward)
-            self.settings_widget.simulation.showTransition.connect(w.showTransition)
             self.settings_widget.driverPos.posChanged.connect(w.driverPosChanged)
-            self.settings_widget.driverPos.posChanged.connect(self.settings_widget.simulation.show_transition)
             self.settings_widget.clientPos.posChanged.connect(w.clientPosChanged)
             self.settings_widget.destPos.posChanged.connect(w.destPosChanged)
             self.settings_widget.incidents.incidentAdded.connect(w.addIncident)
-            self.settings_widget.incidents.incidentAdded.connect(self.settings_widget.simulation.show_transition)
             self.settings_widget.rewards.rewardAdded.connect(w.addReward)
             self.settings_widget.reset.connect(w.reset)
             grid.addWidget(w, position[0], position[1])
+            self.cells.append(w)
+        self.settings_widget.simulation.showTransition.connect(self.showTransition)
+        self.settings_widget.driverPos.posChanged.connect(self.settings_widget.simulation.show_transition)
+        self.settings_widget.incidents.incidentAdded.connect(self.settings_widget.simulation.show_transition)
+
+    @pyqtSlot(dict)
+    def showTransition(self, *args, **kwargs):
+        transitionDetail = self.sender().transition_details
+        probability = transitionDetail["probability"]
+        if transitionDetail["refresh"]:
+            indices = range(len(self.cells))
+        else:
+            indices = transitionDetail["cleared"] + list(probability)
+        for index in indices:
+            self.cells[index].showTransition(probability.get(index, 0.0))
             
             
 class Main(QWidget):
@@ -749,7 +741,24 @@ class Main(QWidget):
         qr.moveCenter(cp)
         self.move(qr.topLeft())
         
+parser = argparse.ArgumentParser(description="MDP taxi route planner.")
+parser.add_argument("--cols", type=int, default=default_col_count)
+parser.add_argument("--rows", type=int, default=default_row_count)
+parser.add_argument("--raster", help="road raster; sets the grid size")
+parser.add_argument("--edges", help="edge list of col,row,action,success")
+parser.add_argument("--epochs", help="JSON file with a list of traffic epochs under \"epochs\"")
+args, qt_args = parser.parse_known_args()
+if args.raster:
+    grid_shape, road = load_raster(args.raster)
+else:
+    grid_shape = GridShape(args.cols, args.rows)
+    road = RoadNetwork(grid_shape)
+if args.edges:
+    load_edges(args.edges, road)
+if args.epochs:
+    with open(args.epochs) as f:
+        epochs = json.load(f)["epochs"]
 initData()
-app = QApplication(sys.argv)
+app = QApplication(sys.argv[:1] + qt_args)
 ex = Main()
 sys.exit(app.exec_())
\ No newline at end of file